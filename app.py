@@ -1,16 +1,15 @@
 import os
 os.environ['TZ'] = 'America/Sao_Paulo'
-import random
-import time
-from flask import Flask, render_template, session, jsonify, request
+from flask import Flask, Response, render_template, session, jsonify, request
 from sqlalchemy import func
-from database import db, init_db, Country, Ranking
-from unidecode import unidecode
-from thefuzz import fuzz
+from database import db, init_db, get_country_difficulty, Country, Ranking
+from live_ranking import RankingBroadcaster
+from leaderboard import get_rank_position, get_top_rankings, to_saopaulo_time
+from game_engine import GameState, allowed_difficulties, apply_guess, give_up as give_up_game, pick_country
+from profiling import init_profiling
 from logger_config import setup_logging, cleanup_old_logs
 from datetime import datetime, timedelta
 import requests
-import pytz
 
 RANKING_LIMIT = 100
 
@@ -20,7 +19,17 @@ database_file = f"sqlite:///{os.path.join(project_dir, 'paises.db')}"
 app.config['SQLALCHEMY_DATABASE_URI'] = database_file
 app.config['SECRET_KEY'] = 'dev_secret_key' # Replace with a real secret key
 
+# Opt-in request profiling, triggered by sampling or by an X-Profile header matching the token
+app.config['PROFILING_ENABLED'] = os.environ.get('PAISES_PROFILING') == '1'
+app.config['PROFILING_SAMPLE_RATE'] = float(os.environ.get('PAISES_PROFILING_SAMPLE_RATE', '0'))
+app.config['PROFILING_HEADER_TOKEN'] = os.environ.get('PAISES_PROFILING_TOKEN')
+app.config['PROFILING_DIR'] = os.path.join(project_dir, 'profiles')
+
 db.init_app(app)
+init_profiling(app)
+
+# One broadcaster per worker pushes leaderboard changes to /ranking/stream clients
+ranking_broadcaster = RankingBroadcaster(app, RANKING_LIMIT)
 
 # Setup logging
 logger = setup_logging()
@@ -30,10 +39,6 @@ for handler in logger.handlers:
     app.logger.addHandler(handler)
 app.logger.setLevel(logger.level)
 
-# Helper function for string normalization
-def normalize_string(s):
-    return unidecode(s).lower().strip()
-
 @app.cli.command('init-db')
 def init_db_command():
     init_db(app)
@@ -59,21 +64,9 @@ def migrate_db_command():
                     logger.info("'difficulty' column added.")
 
                     # Populate difficulty for existing countries
-                    easy_countries = [
-                        "Brasil", "Estados Unidos", "Argentina", "Portugal", "Espanha", "França", "Alemanha", "Itália", "Japão", "China", "Canadá", "México", "Reino Unido"
-                    ]
-                    medium_countries = [
-                        "Chile", "Colômbia", "Peru", "Uruguai", "Paraguai", "Venezuela", "África do Sul", "Austrália", "Nova Zelândia", "Índia", "Rússia", "Egito", "Nigéria", "Suécia", "Noruega", "Finlândia", "Dinamarca", "Países Baixos", "Bélgica", "Suíça", "Áustria", "Grécia", "Turquia", "Arábia Saudita", "Emirados Árabes Unidos", "Israel", "Coreia do Sul", "Tailândia", "Vietnã", "Indonésia"
-                    ]
-
                     countries = Country.query.all()
                     for country in countries:
-                        difficulty = "hard" # Default to hard
-                        if country.name in easy_countries:
-                            difficulty = "easy"
-                        elif country.name in medium_countries:
-                            difficulty = "medium"
-                        country.difficulty = difficulty
+                        country.difficulty = get_country_difficulty(country.name)
                     db.session.commit()
                     logger.info("Difficulty populated for existing countries.")
 
@@ -180,6 +173,27 @@ def migrate_ranking_timestamp_city_command():
         else:
             logger.warning("'ranking' table does not exist.")
 
+@app.cli.command('migrate-ranking-leaderboard-index')
+def migrate_ranking_leaderboard_index_command():
+    with app.app_context():
+        inspector = db.inspect(db.engine)
+
+        if 'ranking' in inspector.get_table_names():
+            index_names = [index['name'] for index in inspector.get_indexes('ranking')]
+            if 'ix_ranking_leaderboard' not in index_names:
+                logger.info("Creating leaderboard index on Ranking table...")
+                try:
+                    for index in Ranking.__table__.indexes:
+                        if index.name == 'ix_ranking_leaderboard':
+                            index.create(db.engine)
+                    logger.info("'ix_ranking_leaderboard' index created.")
+                except Exception as e:
+                    logger.error(f"Error creating leaderboard index: {e}")
+            else:
+                logger.info("'ix_ranking_leaderboard' index already exists.")
+        else:
+            logger.warning("'ranking' table does not exist.")
+
 @app.route('/')
 def index():
     last_difficulty = session.get('difficulty', 'easy')
@@ -192,12 +206,9 @@ def start_game():
     logger.info("Starting game with difficulty: %s", selected_difficulty, extra={'ip_address': request.remote_addr})
 
     # Filter countries by difficulty
-    if selected_difficulty == 'easy':
-        available_countries = Country.query.filter_by(difficulty='easy').all()
-    elif selected_difficulty == 'medium':
-        available_countries = Country.query.filter(Country.difficulty.in_(['easy', 'medium'])).all()
-    elif selected_difficulty == 'hard':
-        available_countries = Country.query.filter(Country.difficulty.in_(['easy', 'medium', 'hard'])).all()
+    difficulties = allowed_difficulties(selected_difficulty)
+    if difficulties:
+        available_countries = Country.query.filter(Country.difficulty.in_(difficulties)).all()
     else:
         # Default to all countries if difficulty is unknown
         available_countries = Country.query.all()
@@ -207,21 +218,10 @@ def start_game():
         return jsonify({'error': 'No countries found for this difficulty.'}), 400
 
     # Prevent picking the same country twice in a row
-    last_country_id = session.get('last_country_id', None)
-    country = None
-    # Ensure a different country is picked if possible, or pick any if only one is available
-    if len(available_countries) > 1:
-        while country is None or country.id == last_country_id:
-            country = random.choice(available_countries)
-    else:
-        country = available_countries[0] # Only one country available
+    country = pick_country(available_countries, session.get('last_country_id', None))
 
-    session['country_id'] = country.id
+    GameState.new(country.id).to_session(session)
     session['last_country_id'] = country.id
-    session['start_time'] = time.time()
-    session['attempts'] = 0
-    session['wrong_guesses'] = []
-    session['game_over'] = False
     session['difficulty'] = selected_difficulty
 
     logger.info(f"Game started. Initial letter: {country.initial_letter}, Country: {country.name}, Difficulty: {country.difficulty}")
@@ -235,61 +235,49 @@ def guess():
     guess_country_name = data.get('guess', '')
     logger.info("Received guess: %s", guess_country_name, extra={'ip_address': request.remote_addr})
 
-    if 'country_id' not in session or session.get('game_over'):
+    state = GameState.from_session(session)
+    if state is None or state.game_over:
         logger.warning("Guess received but game not started or already over.")
         return jsonify({'error': 'Game not started or already over. Please refresh.'}), 400
 
-    target_country = db.session.get(Country, session['country_id'])
+    target_country = db.session.get(Country, state.country_id)
 
-    # Normalize strings for comparison
-    normalized_guess = normalize_string(guess_country_name)
-    normalized_target = normalize_string(target_country.name)
+    # Fuzzy matching over normalized names, tolerant to typos and missing accents
+    result = apply_guess(state, guess_country_name, target_country.name)
+    state.to_session(session)
 
-    # Use fuzzy matching. A ratio of 90 is a good threshold for typos.
-    match_ratio = fuzz.ratio(normalized_guess, normalized_target)
-
-    session['attempts'] += 1
-
-    if match_ratio > 90:
-        time_spent = time.time() - session['start_time']
-        session['game_over'] = True
-        logger.info(f"Player won! Country: {target_country.name}, Time: {time_spent:.2f}s, Attempts: {session['attempts']}")
+    if result.status == 'win':
+        logger.info(f"Player won! Country: {target_country.name}, Time: {result.time_spent:.2f}s, Attempts: {state.attempts}")
         return jsonify({
             'status': 'win',
             'country_name': target_country.name,
             'flag_code': target_country.flag_code,
-            'time_spent': round(time_spent, 2),
-            'attempts': session['attempts']
+            'time_spent': round(result.time_spent, 2),
+            'attempts': state.attempts
         })
-    else:
-        wrong_guesses = session.get('wrong_guesses', [])
-        if normalized_guess and guess_country_name not in wrong_guesses:
-            wrong_guesses.append(guess_country_name)
-            session['wrong_guesses'] = wrong_guesses
-
-        if len(wrong_guesses) >= 10:
-            session['game_over'] = True
-            logger.info(f"Player lost! Country: {target_country.name}, Attempts: {session['attempts']}")
-            return jsonify({
-                'status': 'lose',
-                'country_name': target_country.name, # Ensure this is sent on loss
-                'flag_code': target_country.flag_code,
-                'wrong_guesses': wrong_guesses,
-                'attempts': session['attempts']
-            })
-        
-        logger.info(f"Wrong guess: {guess_country_name}. Attempts: {session['attempts']}")
+    elif result.status == 'lose':
+        logger.info(f"Player lost! Country: {target_country.name}, Attempts: {state.attempts}")
         return jsonify({
-            'status': 'wrong',
-            'message': f'"{guess_country_name}" não é o país correto. Tente novamente.',
-            'wrong_guesses': wrong_guesses,
-            'attempts': session['attempts']
+            'status': 'lose',
+            'country_name': target_country.name, # Ensure this is sent on loss
+            'flag_code': target_country.flag_code,
+            'wrong_guesses': state.wrong_guesses,
+            'attempts': state.attempts
         })
 
+    logger.info(f"Wrong guess: {guess_country_name}. Attempts: {state.attempts}")
+    return jsonify({
+        'status': 'wrong',
+        'message': f'"{guess_country_name}" não é o país correto. Tente novamente.',
+        'wrong_guesses': state.wrong_guesses,
+        'attempts': state.attempts
+    })
+
 @app.route('/save_ranking', methods=['POST'])
 def save_ranking():
     # Ensure game was won and data is in session
-    if 'country_id' not in session or not session.get('game_over') or 'start_time' not in session:
+    state = GameState.from_session(session)
+    if state is None or not state.game_over:
         logger.warning("Attempted to save ranking without valid game data.", extra={'ip_address': request.remote_addr})
         return jsonify({'error': 'No game data to save.'}), 400
 
@@ -299,10 +287,10 @@ def save_ranking():
         logger.warning("Attempted to save ranking without player name.", extra={'ip_address': request.remote_addr})
         return jsonify({'error': 'Player name is required.'}), 400
     
-    target_country = db.session.get(Country, session['country_id'])
+    target_country = db.session.get(Country, state.country_id)
     # Use server-side session data for security and accuracy
-    time_spent = time.time() - session['start_time']
-    attempts = session.get('attempts', 0)
+    time_spent = state.elapsed()
+    attempts = state.attempts
 
     # Geolocation
     x_forwarded_for = request.headers.get('X-Forwarded-For')
@@ -339,23 +327,31 @@ def save_ranking():
     logger.info("Ranking saved for %s (Country: %s, Time: %.2fs, Attempts: %s, Difficulty: %s, City: %s).",
                 player_name, target_country.name, time_spent, attempts, target_country.difficulty, city, extra={'ip_address': ip_address})
 
+    position = get_rank_position(new_ranking)
+    ranking_broadcaster.notify()
+
     session.clear()
-    return jsonify({'status': 'success'})
+    return jsonify({'status': 'success', 'ranking_id': new_ranking.id, 'position': position})
+
+@app.route('/ranking/<int:ranking_id>/position')
+def ranking_position(ranking_id):
+    entry = db.session.get(Ranking, ranking_id)
+    if entry is None:
+        return jsonify({'error': 'Ranking entry not found.'}), 404
+    return jsonify({'ranking_id': entry.id, 'player_name': entry.player_name, 'position': get_rank_position(entry)})
 
 @app.route('/give_up', methods=['POST'])
 def give_up():
-    if 'country_id' not in session:
+    state = GameState.from_session(session)
+    if state is None:
         logger.warning("Attempted to give up without game in progress.", extra={'ip_address': request.remote_addr})
         return jsonify({'error': 'No game in progress.'}), 400
 
-    target_country = db.session.get(Country, session['country_id'])
-    attempts = session.get('attempts', 0)
+    target_country = db.session.get(Country, state.country_id)
+    attempts = state.attempts
 
-    session['game_over'] = True
-    session.pop('country_id', None)
-    session.pop('start_time', None)
-    session.pop('attempts', None)
-    session.pop('wrong_guesses', None)
+    give_up_game(state)
+    state.to_session(session)
 
     logger.info("Player gave up. Country: %s, Attempts: %s", target_country.name, attempts, extra={'ip_address': request.remote_addr})
     return jsonify({
@@ -367,32 +363,32 @@ def give_up():
 
 @app.route('/ranking')
 def ranking():
-    # Define a custom order for difficulty
-    difficulty_order = {'hard': 1, 'medium': 2, 'easy': 3}
-
-    rankings = db.session.query(Ranking).all()
+    # Position of the entry the player just saved, if any
+    position = None
+    entry_id = request.args.get('entry', type=int)
+    if entry_id:
+        entry = db.session.get(Ranking, entry_id)
+        if entry:
+            position = get_rank_position(entry)
 
-    # Define the Sao Paulo timezone
-    saopaulo_tz = pytz.timezone('America/Sao_Paulo')
+    # Ordered by difficulty, then time_spent, then attempts, and limited in the query
+    rankings = get_top_rankings(RANKING_LIMIT)
 
     # Convert UTC timestamps to Sao Paulo timezone
     for r in rankings:
         if r.timestamp:
-            # Ensure the timestamp is timezone-aware UTC before converting
-            if r.timestamp.tzinfo is None:
-                utc_dt = pytz.utc.localize(r.timestamp)
-            else:
-                utc_dt = r.timestamp.astimezone(pytz.utc)
-            r.timestamp = utc_dt.astimezone(saopaulo_tz)
-
-    # Sort in Python based on custom difficulty order, then by time_spent, then attempts
-    rankings.sort(key=lambda x: (difficulty_order.get(x.difficulty, 99), x.time_spent, x.attempts))
-
-    # Limit to RANKING_LIMIT after sorting
-    rankings = rankings[:RANKING_LIMIT]
+            r.timestamp = to_saopaulo_time(r.timestamp)
 
     logger.info("Ranking page accessed.", extra={'ip_address': request.remote_addr})
-    return render_template('ranking.html', rankings=rankings, ranking_limit=RANKING_LIMIT)
+    return render_template('ranking.html', rankings=rankings, ranking_limit=RANKING_LIMIT,
+                           position=position, entry_id=entry_id)
+
+@app.route('/ranking/stream')
+def ranking_stream():
+    client = ranking_broadcaster.subscribe()
+    logger.info("Live ranking stream opened.", extra={'ip_address': request.remote_addr})
+    return Response(ranking_broadcaster.stream(client), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 if __name__ == '__main__':
     cleanup_old_logs()
@@ -23,6 +23,11 @@ class Ranking(db.Model):
     timestamp: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
     city: Mapped[str] = mapped_column(String(100), nullable=True)
 
+    # Matches the leaderboard order so rank lookups are indexed COUNTs
+    __table_args__ = (
+        db.Index('ix_ranking_leaderboard', 'difficulty', 'time_spent', 'attempts', 'id'),
+    )
+
 def get_countries_data():
     return [
         {"name": "Afeganistão", "alpha-2": "AF"},
@@ -222,18 +227,25 @@ def get_countries_data():
         {"name": "Zimbábue", "alpha-2": "ZW"}
     ]
 
+EASY_COUNTRIES = [
+    "Brasil", "Estados Unidos", "Argentina", "Portugal", "Espanha", "França", "Alemanha", "Itália", "Japão", "China", "Canadá", "México", "Reino Unido"
+]
+MEDIUM_COUNTRIES = [
+    "Chile", "Colômbia", "Peru", "Uruguai", "Paraguai", "Venezuela", "África do Sul", "Austrália", "Nova Zelândia", "Índia", "Rússia", "Egito", "Nigéria", "Suécia", "Noruega", "Finlândia", "Dinamarca", "Países Baixos", "Bélgica", "Suíça", "Áustria", "Grécia", "Turquia", "Arábia Saudita", "Emirados Árabes Unidos", "Israel", "Coreia do Sul", "Tailândia", "Vietnã", "Indonésia"
+]
+
+def get_country_difficulty(country_name):
+    if country_name in EASY_COUNTRIES:
+        return "easy"
+    if country_name in MEDIUM_COUNTRIES:
+        return "medium"
+    return "hard" # Default to hard
+
 def init_db(app):
     with app.app_context():
         # db.drop_all() # Removed to prevent data loss
         db.create_all()
         
-        easy_countries = [
-            "Brasil", "Estados Unidos", "Argentina", "Portugal", "Espanha", "França", "Alemanha", "Itália", "Japão", "China", "Canadá", "México", "Reino Unido"
-        ]
-        medium_countries = [
-            "Chile", "Colômbia", "Peru", "Uruguai", "Paraguai", "Venezuela", "África do Sul", "Austrália", "Nova Zelândia", "Índia", "Rússia", "Egito", "Nigéria", "Suécia", "Noruega", "Finlândia", "Dinamarca", "Países Baixos", "Bélgica", "Suíça", "Áustria", "Grécia", "Turquia", "Arábia Saudita", "Emirados Árabes Unidos", "Israel", "Coreia do Sul", "Tailândia", "Vietnã", "Indonésia"
-        ]
-
         # Check if countries are already populated
         # This logic needs to be updated to handle existing countries and new difficulty column
         # For now, it will only add countries if the table is empty.
@@ -242,17 +254,11 @@ def init_db(app):
             countries_data = get_countries_data()
             for country_data in countries_data:
                 country_name = country_data["name"]
-                difficulty = "hard" # Default to hard
-                if country_name in easy_countries:
-                    difficulty = "easy"
-                elif country_name in medium_countries:
-                    difficulty = "medium"
-
                 country = Country(
                     name=country_name,
                     initial_letter=country_data["name"][0].upper(),
                     flag_code=country_data["alpha-2"].lower(),
-                    difficulty=difficulty
+                    difficulty=get_country_difficulty(country_name)
                 )
                 db.session.add(country)
             db.session.commit()
@@ -38,6 +38,7 @@ echo "Setting up virtual environment and installing dependencies..."
 echo "Running database migrations..."
 "$UV_BIN" run flask migrate-db || { echo "Failed to run migrate-db."; exit 1; }
 "$UV_BIN" run flask migrate-ranking-difficulty || { echo "Failed to run migrate-ranking-difficulty."; exit 1; }
+"$UV_BIN" run flask migrate-ranking-leaderboard-index || { echo "Failed to run migrate-ranking-leaderboard-index."; exit 1; }
 
 # --- 5. Set up systemd service ---
 
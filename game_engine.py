@@ -0,0 +1,109 @@
+import random
+import time
+from dataclasses import dataclass, field
+from unidecode import unidecode
+from thefuzz import fuzz
+
+# A ratio above this is accepted as the right country (tolerates typos and missing accents)
+MATCH_THRESHOLD = 90
+MAX_WRONG_GUESSES = 10
+
+# Country difficulties that are playable at each selected difficulty
+DIFFICULTY_POOLS = {
+    'easy': ('easy',),
+    'medium': ('easy', 'medium'),
+    'hard': ('easy', 'medium', 'hard'),
+}
+
+# Helper function for string normalization
+def normalize_string(s):
+    return unidecode(s).lower().strip()
+
+def match_ratio(guess, target):
+    return fuzz.ratio(normalize_string(guess), normalize_string(target))
+
+def allowed_difficulties(selected_difficulty):
+    """Returns the country difficulties for a game, or None to allow every country."""
+    return DIFFICULTY_POOLS.get(selected_difficulty)
+
+def pick_country(countries, last_country_id=None, rng=random):
+    """Picks a country, avoiding the previous one whenever there is another choice."""
+    if not countries:
+        return None
+    if len(countries) == 1:
+        return countries[0]
+    country = None
+    while country is None or country.id == last_country_id:
+        country = rng.choice(countries)
+    return country
+
+@dataclass(slots=True)
+class GameState:
+    country_id: int
+    start_time: float
+    attempts: int = 0
+    wrong_guesses: list = field(default_factory=list)
+    game_over: bool = False
+    given_up: bool = False
+
+    @classmethod
+    def new(cls, country_id, now=None):
+        return cls(country_id=country_id, start_time=time.time() if now is None else now)
+
+    @classmethod
+    def from_session(cls, session):
+        if 'country_id' not in session or 'start_time' not in session:
+            return None
+        return cls(
+            country_id=session['country_id'],
+            start_time=session['start_time'],
+            attempts=session.get('attempts', 0),
+            wrong_guesses=list(session.get('wrong_guesses', [])),
+            game_over=session.get('game_over', False),
+        )
+
+    def to_session(self, session):
+        if self.given_up:
+            # A game given up keeps no state, so it can be neither guessed nor saved to the ranking
+            for key in ('country_id', 'start_time', 'attempts', 'wrong_guesses'):
+                session.pop(key, None)
+            session['game_over'] = True
+            return
+        session['country_id'] = self.country_id
+        session['start_time'] = self.start_time
+        session['attempts'] = self.attempts
+        session['wrong_guesses'] = self.wrong_guesses
+        session['game_over'] = self.game_over
+
+    def elapsed(self, now=None):
+        return (time.time() if now is None else now) - self.start_time
+
+@dataclass(slots=True)
+class GuessResult:
+    status: str  # 'win', 'wrong' or 'lose'
+    match_ratio: int
+    time_spent: float = 0.0
+
+def apply_guess(state, guess, target_name, now=None):
+    """Applies one guess to the game state and returns its outcome."""
+    ratio = match_ratio(guess, target_name)
+
+    state.attempts += 1
+
+    if ratio > MATCH_THRESHOLD:
+        state.game_over = True
+        return GuessResult('win', ratio, state.elapsed(now))
+
+    if normalize_string(guess) and guess not in state.wrong_guesses:
+        state.wrong_guesses.append(guess)
+
+    if len(state.wrong_guesses) >= MAX_WRONG_GUESSES:
+        state.game_over = True
+        return GuessResult('lose', ratio)
+
+    return GuessResult('wrong', ratio)
+
+def give_up(state):
+    """Ends the game without a result."""
+    state.game_over = True
+    state.given_up = True
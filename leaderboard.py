@@ -0,0 +1,86 @@
+import pytz
+from sqlalchemy import func, tuple_
+from database import db, Ranking
+
+# Custom order for difficulty: harder games rank first, unknown difficulties last
+DIFFICULTY_ORDER = {'hard': 1, 'medium': 2, 'easy': 3}
+UNKNOWN_DIFFICULTY_ORDER = 99
+
+SAOPAULO_TZ = pytz.timezone('America/Sao_Paulo')
+
+def to_saopaulo_time(timestamp):
+    # Ensure the timestamp is timezone-aware UTC before converting
+    if timestamp.tzinfo is None:
+        utc_dt = pytz.utc.localize(timestamp)
+    else:
+        utc_dt = timestamp.astimezone(pytz.utc)
+    return utc_dt.astimezone(SAOPAULO_TZ)
+
+def difficulty_order(difficulty):
+    return DIFFICULTY_ORDER.get(difficulty, UNKNOWN_DIFFICULTY_ORDER)
+
+def leaderboard_key(entry):
+    """Leaderboard ordering: difficulty, then time_spent, then attempts (id breaks ties)."""
+    return (difficulty_order(entry.difficulty), entry.time_spent, entry.attempts, entry.id)
+
+def _same_difficulty(difficulty):
+    if difficulty in DIFFICULTY_ORDER:
+        return Ranking.difficulty == difficulty
+    # Every unknown difficulty shares the last place in the order
+    return db.or_(Ranking.difficulty.is_(None), Ranking.difficulty.notin_(list(DIFFICULTY_ORDER)))
+
+def _top_in_difficulty(difficulty, limit):
+    return (db.session.query(Ranking)
+            .filter(_same_difficulty(difficulty))
+            .order_by(Ranking.time_spent, Ranking.attempts, Ranking.id)
+            .limit(limit)
+            .all())
+
+def get_top_rankings(limit):
+    """Returns the top entries of the leaderboard.
+
+    Runs one query per difficulty, hardest first, so each one is a range read on
+    ix_ranking_leaderboard; unknown difficulties are only queried if rows are missing.
+    """
+    rankings = []
+    for difficulty in sorted(DIFFICULTY_ORDER, key=DIFFICULTY_ORDER.get):
+        if len(rankings) >= limit:
+            return rankings
+        rankings += _top_in_difficulty(difficulty, limit - len(rankings))
+    if len(rankings) < limit:
+        rankings += _top_in_difficulty(None, limit - len(rankings))
+    return rankings
+
+def _count(*criteria):
+    return db.session.query(func.count(Ranking.id)).filter(*criteria).scalar()
+
+def _position(rank, total):
+    return {
+        'rank': rank,
+        'total': total,
+        # Share of the leaderboard ranked behind this entry
+        'percentile': round(100.0 * (total - rank) / total, 1),
+    }
+
+def get_rank_position(entry):
+    """Computes the global and per-difficulty rank of a ranking entry.
+
+    Both ranks are indexed COUNTs over ix_ranking_leaderboard: the entries of the
+    same difficulty ahead of this one, plus every entry of a harder difficulty.
+    """
+    same_difficulty = _same_difficulty(entry.difficulty)
+    ahead_in_difficulty = _count(
+        same_difficulty,
+        tuple_(Ranking.time_spent, Ranking.attempts, Ranking.id) < (entry.time_spent, entry.attempts, entry.id),
+    )
+    difficulty_total = _count(same_difficulty)
+
+    order = difficulty_order(entry.difficulty)
+    harder_difficulties = [d for d, o in DIFFICULTY_ORDER.items() if o < order]
+    ahead_in_harder = _count(Ranking.difficulty.in_(harder_difficulties)) if harder_difficulties else 0
+    total = _count()
+
+    return {
+        'global': _position(ahead_in_harder + ahead_in_difficulty + 1, total),
+        'difficulty': dict(_position(ahead_in_difficulty + 1, difficulty_total), difficulty=entry.difficulty),
+    }
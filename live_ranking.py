@@ -0,0 +1,145 @@
+import json
+import queue
+import threading
+from sqlalchemy import func
+from database import db, Ranking
+from leaderboard import get_top_rankings, leaderboard_key, to_saopaulo_time
+
+# Comment lines keep idle connections (and proxies) from timing out
+HEARTBEAT_INTERVAL = 15
+# Clients further behind than this are disconnected; EventSource reconnects and resyncs
+CLIENT_QUEUE_SIZE = 20
+
+def serialize_entry(entry):
+    return {
+        'id': entry.id,
+        'player_name': entry.player_name,
+        'country_name': entry.country_name,
+        'difficulty': entry.difficulty,
+        'time_spent': int(round(entry.time_spent)),
+        'attempts': entry.attempts,
+        'timestamp': to_saopaulo_time(entry.timestamp).strftime('%d/%m/%Y %H:%M') if entry.timestamp else '',
+        'city': entry.city,
+    }
+
+class RankingBroadcaster:
+    """Pushes top-K leaderboard changes to every connected SSE client of this worker.
+
+    A single poller thread per worker watches MAX(ranking.id), so scores saved by
+    other workers are picked up too; save_ranking calls notify() to skip the wait.
+    The top-K query runs once per change, not once per client, and only when a new
+    score can enter the current top-K. Each event only carries the new order plus
+    the entries clients have not seen yet.
+    """
+
+    def __init__(self, app, limit, poll_interval=2.0):
+        self.app = app
+        self.limit = limit
+        self.poll_interval = poll_interval
+        self._clients = set()
+        self._clients_lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._last_id = None
+        self._snapshot = []
+        self._cutoff = None  # Leaderboard key of the last entry of a full snapshot
+
+    def notify(self):
+        self._wakeup.set()
+
+    def subscribe(self):
+        client = queue.Queue(maxsize=CLIENT_QUEUE_SIZE)
+        with self._refresh_lock:
+            # Bring the snapshot up to date before handing it to the new client
+            self._refresh()
+            client.put(self._event(self._snapshot, self._snapshot))
+            with self._clients_lock:
+                self._clients.add(client)
+        self._ensure_started()
+        return client
+
+    def unsubscribe(self, client):
+        with self._clients_lock:
+            self._clients.discard(client)
+
+    def stream(self, client):
+        try:
+            while True:
+                try:
+                    event = client.get(timeout=HEARTBEAT_INTERVAL)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                if event is None:
+                    # Dropped for falling behind
+                    return
+                yield f"data: {event}\n\n"
+        finally:
+            self.unsubscribe(client)
+
+    def _ensure_started(self):
+        with self._clients_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='ranking-broadcaster', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            with self._clients_lock:
+                if not self._clients:
+                    continue
+            try:
+                with self.app.app_context(), self._refresh_lock:
+                    self._refresh()
+            except Exception as e:
+                self.app.logger.error(f"Error refreshing live ranking: {e}")
+
+    def _refresh(self):
+        last_id = db.session.query(func.max(Ranking.id)).scalar()
+        if last_id == self._last_id:
+            return
+        if self._cutoff is not None and self._last_id is not None:
+            new_rows = (db.session.query(Ranking)
+                        .filter(Ranking.id > self._last_id)
+                        .limit(self.limit + 1)
+                        .all())
+            # Scores that sort after a full snapshot cannot change the top-K
+            if len(new_rows) <= self.limit and all(leaderboard_key(r) > self._cutoff for r in new_rows):
+                self._last_id = last_id
+                return
+        self._last_id = last_id
+
+        rankings = get_top_rankings(self.limit)
+        self._cutoff = leaderboard_key(rankings[-1]) if len(rankings) >= self.limit else None
+        entries = [serialize_entry(r) for r in rankings]
+        known_ids = {e['id'] for e in self._snapshot}
+        new_entries = [e for e in entries if e['id'] not in known_ids]
+        changed = [e['id'] for e in entries] != [e['id'] for e in self._snapshot]
+        self._snapshot = entries
+        if changed:
+            self._publish(self._event(entries, new_entries))
+
+    def _event(self, entries, new_entries):
+        return json.dumps({'order': [e['id'] for e in entries], 'entries': new_entries}, ensure_ascii=False)
+
+    def _publish(self, event):
+        # Serialized once, then fanned out to every client queue
+        with self._clients_lock:
+            for client in list(self._clients):
+                try:
+                    client.put_nowait(event)
+                except queue.Full:
+                    self._drop(client)
+
+    def _drop(self, client):
+        self._clients.discard(client)
+        # Replace the backlog with the disconnect marker
+        while True:
+            try:
+                client.get_nowait()
+            except queue.Empty:
+                break
+        client.put_nowait(None)
@@ -0,0 +1,174 @@
+import cProfile
+import glob
+import hmac
+import json
+import os
+import pstats
+import random
+import re
+import time
+from collections import defaultdict
+import click
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+PROFILE_DEFAULTS = {
+    'PROFILING_ENABLED': False,
+    'PROFILING_SAMPLE_RATE': 0.0,       # Fraction of requests profiled without the header
+    'PROFILING_HEADER': 'X-Profile',
+    'PROFILING_HEADER_TOKEN': None,     # The header only triggers profiling when it matches this
+    'PROFILING_DIR': 'profiles',
+    'PROFILING_MAX_FILES': 200,         # Oldest profiles are removed beyond this
+    'PROFILING_TOP_FUNCTIONS': 25,
+}
+
+def init_profiling(app):
+    for key, value in PROFILE_DEFAULTS.items():
+        app.config.setdefault(key, value)
+
+    # SQL timing hooks are only installed when profiling is on
+    if app.config['PROFILING_ENABLED'] and not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    @app.before_request
+    def start_profile():
+        if not app.config['PROFILING_ENABLED'] or not _should_profile(app):
+            return
+        profiler = cProfile.Profile()
+        g._profile = {
+            'profiler': profiler,
+            'queries': [],
+            'wall_start': time.perf_counter(),
+            'cpu_start': time.thread_time(),
+        }
+        profiler.enable()
+
+    @app.after_request
+    def finish_profile(response):
+        profile = g.pop('_profile', None)
+        if profile is not None:
+            profile['profiler'].disable()
+            try:
+                path = save_profile(app, profile, response.status_code)
+                app.logger.info(f"Request profile saved to {path}")
+            except OSError as e:
+                app.logger.error(f"Could not save request profile: {e}")
+        return response
+
+    @app.teardown_request
+    def discard_profile(exc):
+        # Requests that failed before after_request still have the profiler running
+        profile = g.pop('_profile', None)
+        if profile is not None:
+            profile['profiler'].disable()
+
+    @app.cli.command('profiles')
+    @click.option('--route', default=None, help="Only show profiles of this route.")
+    @click.option('--limit', default=10, show_default=True, help="Number of slowest requests to list.")
+    def profiles_command(route, limit):
+        """List and summarise the slowest profiled requests by route."""
+        profiles = load_profiles(app.config['PROFILING_DIR'])
+        if route:
+            profiles = [p for p in profiles if p['route'] == route]
+        if not profiles:
+            click.echo("No profiles captured.")
+            return
+
+        by_route = defaultdict(list)
+        for p in profiles:
+            by_route[(p['method'], p['route'])].append(p)
+
+        click.echo(f"{'Route':<32} {'Count':>6} {'Avg wall':>10} {'Max wall':>10} {'Avg CPU':>10} {'Avg SQL':>8}")
+        for (method, rule), items in sorted(by_route.items(), key=lambda kv: -max(p['wall_time'] for p in kv[1])):
+            count = len(items)
+            click.echo(f"{method + ' ' + rule:<32} {count:>6} "
+                       f"{sum(p['wall_time'] for p in items) / count * 1000:>8.1f}ms "
+                       f"{max(p['wall_time'] for p in items) * 1000:>8.1f}ms "
+                       f"{sum(p['cpu_time'] for p in items) / count * 1000:>8.1f}ms "
+                       f"{sum(len(p['queries']) for p in items) / count:>8.1f}")
+
+        click.echo("")
+        click.echo(f"Slowest {limit} requests:")
+        for p in sorted(profiles, key=lambda p: -p['wall_time'])[:limit]:
+            sql_time = sum(q['duration'] for q in p['queries'])
+            click.echo(f"  {p['captured_at']} {p['method']} {p['path']} -> {p['status']} "
+                       f"wall {p['wall_time'] * 1000:.1f}ms, CPU {p['cpu_time'] * 1000:.1f}ms, "
+                       f"{len(p['queries'])} queries ({sql_time * 1000:.1f}ms)")
+            for func in p['functions'][:3]:
+                click.echo(f"      {func['cumulative'] * 1000:8.1f}ms  {func['function']}")
+            click.echo(f"      python -m pstats {p['stats_file']}")
+
+def _should_profile(app):
+    # Without a configured token the header is ignored, so anonymous clients cannot force profiles
+    token = app.config['PROFILING_HEADER_TOKEN']
+    header_value = request.headers.get(app.config['PROFILING_HEADER'], '')
+    # Compared as bytes: compare_digest rejects non-ASCII strings, and header values are client-controlled
+    if token and hmac.compare_digest(header_value.encode('utf-8'), token.encode('utf-8')):
+        return True
+    return random.random() < app.config['PROFILING_SAMPLE_RATE']
+
+# The start time lives on the execution context, so statements that raise leave nothing behind
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and '_profile' in g:
+        context._profile_query_start = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, '_profile_query_start', None)
+    if start is None or not has_request_context() or '_profile' not in g:
+        return
+    g._profile['queries'].append({'statement': statement, 'duration': time.perf_counter() - start})
+
+def save_profile(app, profile, status_code):
+    wall_time = time.perf_counter() - profile['wall_start']
+    cpu_time = time.thread_time() - profile['cpu_start']
+    profile_dir = app.config['PROFILING_DIR']
+    os.makedirs(profile_dir, exist_ok=True)
+
+    route = request.url_rule.rule if request.url_rule else request.path
+    slug = re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_') or 'root'
+    base_name = os.path.join(profile_dir, f"{time.time_ns()}-{os.getpid()}-{slug}")
+
+    stats = pstats.Stats(profile['profiler'])
+    stats.dump_stats(base_name + '.prof')
+    functions = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)
+
+    with open(base_name + '.json', 'w', encoding='utf-8') as f:
+        json.dump({
+            'captured_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'method': request.method,
+            'route': route,
+            'path': request.full_path.rstrip('?'),
+            'status': status_code,
+            'wall_time': wall_time,
+            'cpu_time': cpu_time,
+            'queries': profile['queries'],
+            'functions': [
+                {'function': f"{func} ({os.path.basename(filename)}:{line})", 'calls': nc, 'cumulative': ct}
+                for (filename, line, func), (cc, nc, tt, ct, callers) in functions[:app.config['PROFILING_TOP_FUNCTIONS']]
+            ],
+            'stats_file': base_name + '.prof',
+        }, f, ensure_ascii=False, indent=2)
+
+    _rotate_profiles(profile_dir, app.config['PROFILING_MAX_FILES'])
+    return base_name + '.json'
+
+def _rotate_profiles(profile_dir, max_files):
+    summaries = sorted(glob.glob(os.path.join(profile_dir, '*.json')))
+    for summary in summaries[:max(0, len(summaries) - max_files)]:
+        for path in (summary, summary[:-len('.json')] + '.prof'):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+def load_profiles(profile_dir):
+    profiles = []
+    for path in glob.glob(os.path.join(profile_dir, '*.json')):
+        try:
+            with open(path, encoding='utf-8') as f:
+                profiles.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return profiles
@@ -0,0 +1,182 @@
+"""Plays synthetic games against the game engine, without HTTP or a database.
+
+Measures how well the fuzzy match threshold accepts typos and accent variants of
+the right country (and rejects other countries), and the engine throughput.
+
+Usage: python simulate.py --games 1000000 --workers 8 --difficulty hard
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import time
+from collections import Counter, namedtuple
+from unidecode import unidecode
+from database import get_countries_data, get_country_difficulty
+from game_engine import GameState, allowed_difficulties, apply_guess, pick_country
+
+SimCountry = namedtuple('SimCountry', ['id', 'name', 'difficulty'])
+
+ACCENTED_VOWELS = {
+    'a': 'áàâã', 'e': 'éê', 'i': 'í', 'o': 'óôõ', 'u': 'ú', 'c': 'ç',
+}
+LETTERS = 'abcdefghijklmnopqrstuvwxyz'
+
+# Countries of the current pool, set once per worker process
+_countries = []
+
+def load_countries(difficulty):
+    countries = [
+        SimCountry(i, data["name"], get_country_difficulty(data["name"]))
+        for i, data in enumerate(get_countries_data(), start=1)
+    ]
+    difficulties = allowed_difficulties(difficulty)
+    if difficulties:
+        countries = [c for c in countries if c.difficulty in difficulties]
+    return countries
+
+# Guess generators: each one takes the country name and returns what the player typed
+
+def exact(name, rng):
+    return name
+
+def strip_accents(name, rng):
+    return unidecode(name)
+
+def wrong_accent(name, rng):
+    positions = [i for i, ch in enumerate(name) if ch.lower() in ACCENTED_VOWELS]
+    if not positions:
+        return name
+    i = rng.choice(positions)
+    return name[:i] + rng.choice(ACCENTED_VOWELS[name[i].lower()]) + name[i + 1:]
+
+def change_case(name, rng):
+    return rng.choice((name.lower(), name.upper(), name.swapcase()))
+
+def drop_char(name, rng):
+    i = rng.randrange(len(name))
+    return name[:i] + name[i + 1:]
+
+def double_char(name, rng):
+    i = rng.randrange(len(name))
+    return name[:i] + name[i] + name[i:]
+
+def swap_chars(name, rng):
+    if len(name) < 2:
+        return name
+    i = rng.randrange(len(name) - 1)
+    return name[:i] + name[i + 1] + name[i] + name[i + 2:]
+
+def substitute_char(name, rng):
+    i = rng.randrange(len(name))
+    return name[:i] + rng.choice(LETTERS) + name[i + 1:]
+
+def two_typos(name, rng):
+    first, second = rng.sample(SINGLE_TYPOS, 2)
+    return second(first(name, rng), rng)
+
+SINGLE_TYPOS = [drop_char, double_char, swap_chars, substitute_char]
+GENERATORS = [exact, strip_accents, wrong_accent, change_case] + SINGLE_TYPOS + [two_typos]
+
+def play_game(rng, skill, stats, last_country_id=None):
+    """Plays one game and records every guess in stats; returns the target country."""
+    target = pick_country(_countries, last_country_id, rng)
+    state = GameState.new(target.id, now=0.0)
+
+    while not state.game_over:
+        if rng.random() < skill:
+            generator = rng.choice(GENERATORS)
+            kind = generator.__name__
+            guess = generator(target.name, rng)
+        else:
+            kind = 'other_country'
+            other = pick_country(_countries, target.id, rng)
+            guess = other.name
+
+        result = apply_guess(state, guess, target.name, now=float(state.attempts))
+        stats['guesses'][kind] += 1
+        if result.status == 'win':
+            stats['accepted'][kind] += 1
+            if kind == 'other_country':
+                stats['confusions'][(guess, target.name)] += 1
+
+    stats['outcomes'][result.status] += 1
+    stats['attempts'][result.status] += state.attempts
+    return target
+
+def _init_worker(difficulty):
+    global _countries
+    _countries = load_countries(difficulty)
+
+def _run_chunk(args):
+    seed, games, skill = args
+    rng = random.Random(seed)
+    stats = {key: Counter() for key in ('guesses', 'accepted', 'outcomes', 'attempts', 'confusions')}
+    last_country_id = None
+    for _ in range(games):
+        last_country_id = play_game(rng, skill, stats, last_country_id).id
+    return stats
+
+def run_simulation(games, workers, difficulty, skill, seed, chunk_size):
+    chunks = []
+    remaining = games
+    while remaining > 0:
+        size = min(chunk_size, remaining)
+        chunks.append((seed + len(chunks), size, skill))
+        remaining -= size
+
+    totals = {key: Counter() for key in ('guesses', 'accepted', 'outcomes', 'attempts', 'confusions')}
+    start = time.perf_counter()
+    if workers == 1:
+        _init_worker(difficulty)
+        for stats in map(_run_chunk, chunks):
+            for key, counter in stats.items():
+                totals[key].update(counter)
+    else:
+        with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(difficulty,)) as pool:
+            for stats in pool.imap_unordered(_run_chunk, chunks):
+                for key, counter in stats.items():
+                    totals[key].update(counter)
+    elapsed = time.perf_counter() - start
+    return totals, elapsed
+
+def print_report(totals, elapsed, games):
+    total_guesses = sum(totals['guesses'].values())
+    print(f"Games: {games}  Guesses: {total_guesses}  Elapsed: {elapsed:.2f}s")
+    print(f"Throughput: {games / elapsed:,.0f} games/s, {total_guesses / elapsed:,.0f} guesses/s")
+
+    for status in ('win', 'lose'):
+        count = totals['outcomes'][status]
+        average = totals['attempts'][status] / count if count else 0
+        print(f"  {status}: {count} games, {average:.2f} attempts on average")
+
+    print("Match threshold acceptance by guess kind:")
+    for generator in GENERATORS:
+        kind = generator.__name__
+        guesses = totals['guesses'][kind]
+        if guesses:
+            print(f"  {kind:<16} {totals['accepted'][kind] / guesses:8.2%} of {guesses}")
+    guesses = totals['guesses']['other_country']
+    if guesses:
+        print(f"  {'other_country':<16} {totals['accepted']['other_country'] / guesses:8.2%} of {guesses} (false accepts)")
+
+    for (guess, target), count in totals['confusions'].most_common(10):
+        print(f"    '{guess}' accepted for '{target}': {count}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate games against the pAIses game engine.")
+    parser.add_argument('--games', type=int, default=100000, help="Number of games to play.")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Worker processes.")
+    parser.add_argument('--difficulty', default='hard', choices=['easy', 'medium', 'hard'])
+    parser.add_argument('--skill', type=float, default=0.5,
+                        help="Probability that a guess is a variant of the right country.")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--chunk-size', type=int, default=10000, help="Games per worker task.")
+    args = parser.parse_args()
+
+    totals, elapsed = run_simulation(args.games, max(1, args.workers), args.difficulty,
+                                     args.skill, args.seed, args.chunk_size)
+    print_report(totals, elapsed, args.games)
+
+if __name__ == '__main__':
+    main()